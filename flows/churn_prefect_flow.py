@@ -1,77 +1,112 @@
-from prefect import flow, task, get_run_logger
-import subprocess
+import os
 import sys
+from pathlib import Path
+from datetime import datetime
+from prefect import flow, task, get_run_logger
+from prefect.task_runners import ThreadPoolTaskRunner
+
+# Pipeline steps run in-process. As a script (python flows/churn_prefect_flow.py) sys.path[0]
+# is flows/, so put the project root on the path to make `src` importable; run from the
+# project root so the relative data paths resolve
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.ingest import ingest_csv, ingest_api
+from src.local_storage import run_storage, retire_old_artifacts
+from src.validate import run_validation
+from src.prepare import run_preparation
+from src.transform import run_transformation
+from src.feature_store import run_feature_store
+from src.train import run_training
 
 # -----------------------------
 # Define Tasks
 # -----------------------------
-@task(retries=2, retry_delay_seconds=10)
-def ingest():
-    logger = get_run_logger()
-    logger.info("Starting ingestion...")
-    subprocess.check_call([sys.executable, "src/ingest.py"])
-    logger.info("Ingestion completed.")
-
 @task(retries=2, retry_delay_seconds=10)
 def local_storage():
     logger = get_run_logger()
     logger.info("Storing data locally...")
-    subprocess.check_call([sys.executable, "../src/local_storage.py"])
+    run_storage()
     logger.info("Local storage done.")
 
 @task(retries=2, retry_delay_seconds=10)
 def validate():
     logger = get_run_logger()
     logger.info("Validating data...")
-    subprocess.check_call([sys.executable, "src/validate.py"])
+    run_validation()
     logger.info("Validation completed.")
 
 @task(retries=2, retry_delay_seconds=10)
 def prepare():
     logger = get_run_logger()
     logger.info("Preparing data...")
-    subprocess.check_call([sys.executable, "src/prepare.py"])
+    prepared = run_preparation()
     logger.info("Preparation completed.")
+    return prepared
 
 @task(retries=2, retry_delay_seconds=10)
-def transform():
+def transform(prepared):
     logger = get_run_logger()
     logger.info("Transforming data...")
-    subprocess.check_call([sys.executable, "src/transform.py"])
+    transformed = run_transformation(prepared)
     logger.info("Transformation completed.")
+    return transformed
 
 @task(retries=2, retry_delay_seconds=10)
 def feature_store():
     logger = get_run_logger()
     logger.info("Storing features in feature store...")
-    subprocess.check_call([sys.executable, "src/feature_store.py"])
+    splits = run_feature_store()
     logger.info("Feature store updated.")
+    return splits
 
 @task(retries=2, retry_delay_seconds=10)
-def train():
+def train(splits):
     logger = get_run_logger()
     logger.info("Training model...")
-    subprocess.check_call([sys.executable, "src/train.py"])
+    run_training(splits)
     logger.info("Model training completed.")
 
+@task(retries=2, retry_delay_seconds=10)
+def gc_artifacts(keep=20):
+    logger = get_run_logger()
+    logger.info("Retiring old artifacts...")
+    removed = retire_old_artifacts(keep)
+    logger.info(f"Artifact retention done ({removed} removed).")
+
 # -----------------------------
 # Define Flow
 # -----------------------------
-@flow(name="Churn Prediction Pipeline")
+@flow(name="Churn Prediction Pipeline", task_runner=ThreadPoolTaskRunner())
 def churn_pipeline():
-    # Just call tasks in order, Prefect handles scheduling and retries
-    ingest()
-    local_storage()
-    validate()
-    prepare()
-    transform()
-    feature_store()
-    train()
-	
+    # One timestamp for every artifact this run versions; the src modules read it
+    os.environ["CHURN_RUN_TS"] = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Submit tasks with their real dependencies so independent branches run concurrently:
+    #   ingest_csv + ingest_api -> local_storage -> validate
+    #                                            -> prepare -> transform
+    #   feature_store (pulls its own sources) -> train
+    #   gc_artifacts once every branch is done
+    csv_fut = ingest_csv.submit()
+    api_fut = ingest_api.submit()
+    storage_fut = local_storage.submit(wait_for=[csv_fut, api_fut])
+
+    validate_fut = validate.submit(wait_for=[storage_fut])
+    prepare_fut = prepare.submit(wait_for=[storage_fut])
+    transform_fut = transform.submit(prepare_fut)
+
+    splits_fut = feature_store.submit()
+    train_fut = train.submit(splits_fut)
+
+    gc_fut = gc_artifacts.submit(wait_for=[validate_fut, transform_fut, train_fut])
+
+    # Resolve the leaves so a failed branch fails the flow run
+    for fut in (validate_fut, transform_fut, train_fut, gc_fut):
+        fut.result()
+
 def setup_scheduled_deployment():
     """Set up scheduled deployment using modern Prefect 3.x serve() method"""
     print("Setting up scheduled deployment using flow.serve()...")
-   
+
     # Use the modern serve() method with cron schedule
     churn_pipeline.serve(
         name="churn_pipeline_5min",
@@ -1,8 +1,11 @@
 import os
 import json
 import shutil
+import numpy as np
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+from requests_cache import CachedSession
 from sklearn.model_selection import train_test_split
 from datetime import datetime
 
@@ -16,6 +19,20 @@ os.makedirs(RAW_DIR, exist_ok=True)
 os.makedirs(PROC_DIR, exist_ok=True)
 os.makedirs(WH_DIR, exist_ok=True)
 
+# Shares data/http_cache.sqlite with ingest.py, so the users API is fetched once per hour
+SESSION = CachedSession("data/http_cache", expire_after=3600, cache_control=True)
+
+CSV_URL = "https://raw.githubusercontent.com/SohelRaja/Customer-Churn-Analysis/master/Decision%20Tree/WA_Fn-UseC_-Telco-Customer-Churn.csv"
+API_URL = "https://jsonplaceholder.typicode.com/users"
+
+# Known numeric Telco columns; declaring them skips type inference while parsing.
+# TotalCharges stays text (it has blank entries) and is ordinal-encoded by train.py.
+CHURN_DTYPES = {
+    "SeniorCitizen": "int64",
+    "tenure": "int64",
+    "MonthlyCharges": "float64",
+}
+
 # -----------------------------
 # Feature Metadata (initial)
 # -----------------------------
@@ -40,11 +57,12 @@ class FeatureStore:
         self.wh_dir = warehouse_dir
         self.metadata = metadata
         self.df = None
-        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Shared run timestamp set by the flow, so every stage versions with the same stamp
+        self.timestamp = os.environ.get("CHURN_RUN_TS") or datetime.now().strftime("%Y%m%d_%H%M%S")
     
     # -------- Load Data --------
     def load_csv(self, csv_url):
-        df_csv = pd.read_csv(csv_url)
+        df_csv = pd.read_csv(csv_url, engine="pyarrow", dtype=CHURN_DTYPES)
         # Version raw CSV
         raw_file_versioned = os.path.join(self.raw_dir, f"churn_raw_{self.timestamp}.csv")
         df_csv.to_csv(raw_file_versioned, index=False)
@@ -52,7 +70,7 @@ class FeatureStore:
         return df_csv
 
     def load_api(self, api_url):
-        response = requests.get(api_url)
+        response = SESSION.get(api_url, timeout=10)
         response.raise_for_status()
         df_api = pd.DataFrame(response.json())
         print(f"[FeatureStore] Loaded API data ({len(df_api)} rows)")
@@ -64,15 +82,16 @@ class FeatureStore:
         
         if api_url:
             df_api = self.load_api(api_url)
-            # Align API data with CSV rows
-            df_api = df_api.reindex(df_csv.index, method='ffill')
-            self.df = pd.concat([df_csv, df_api[['username','email']]], axis=1)
+            # Align API data with CSV rows by cycling the API users over the CSV rows
+            users = np.resize(df_api[['username', 'email']].to_numpy(), (len(df_csv), 2))
+            df_csv[['username', 'email']] = users
+            self.df = df_csv
         else:
             self.df = df_csv
 
-        # Version transformed data
-        transformed_file_versioned = os.path.join(self.proc_dir, f"transformed_{self.timestamp}.csv")
-        self.df.to_csv(transformed_file_versioned, index=False)
+        # Version transformed data (raw copy above stays CSV for lineage)
+        transformed_file_versioned = os.path.join(self.proc_dir, f"transformed_{self.timestamp}.parquet")
+        self.df.to_parquet(transformed_file_versioned, engine="pyarrow", compression="zstd", index=False)
         print(f"[FeatureStore] Transformed dataset saved as {transformed_file_versioned}")
 
         # Save feature metadata
@@ -85,7 +104,7 @@ class FeatureStore:
         version_meta = {
             "timestamp": self.timestamp,
             "raw_data": f"churn_raw_{self.timestamp}.csv",
-            "transformed_data": f"transformed_{self.timestamp}.csv",
+            "transformed_data": f"transformed_{self.timestamp}.parquet",
             "source": {"csv": csv_url, "api": api_url},
             "changes": "Initial ingestion + API merge"
         }
@@ -100,12 +119,23 @@ class FeatureStore:
         y = self.df[target_col]
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state)
 
-        # Save train/test sets with version
-        X_train.to_csv(os.path.join(self.wh_dir, f"X_train_{self.timestamp}.csv"), index=False)
-        X_test.to_csv(os.path.join(self.wh_dir, f"X_test_{self.timestamp}.csv"), index=False)
-        y_train.to_csv(os.path.join(self.wh_dir, f"y_train_{self.timestamp}.csv"), index=False)
-        y_test.to_csv(os.path.join(self.wh_dir, f"y_test_{self.timestamp}.csv"), index=False)
-        print(f"[FeatureStore] Train/Test sets saved with timestamp {self.timestamp}")
+        # Save train/test sets with version into one Hive-partitioned Parquet dataset:
+        # <warehouse>/splits/split=train|test/run_ts=<timestamp>/
+        splits = pd.concat([
+            X_train.assign(**{target_col: y_train}, split="train", run_ts=self.timestamp),
+            X_test.assign(**{target_col: y_test}, split="test", run_ts=self.timestamp),
+        ])
+        splits_dir = os.path.join(self.wh_dir, "splits")
+        pq.write_to_dataset(
+            pa.Table.from_pandas(splits, preserve_index=False),
+            splits_dir,
+            partition_cols=["split", "run_ts"],
+            compression="zstd",
+            # A retry reuses the run's timestamp: replace that run's partitions, don't append to them
+            existing_data_behavior="delete_matching",
+        )
+        print(f"[FeatureStore] Train/Test sets saved in {splits_dir} with timestamp {self.timestamp}")
+        return X_train, X_test, y_train, y_test
 
     # -------- Feature Retrieval --------
     def get_feature(self, feature_name):
@@ -114,13 +144,19 @@ class FeatureStore:
         else:
             raise ValueError(f"Feature '{feature_name}' not found in feature store.")
 
+# -----------------------------
+# Main Runner
+# -----------------------------
+def run_feature_store():
+    """Build the versioned feature store; returns (X_train, X_test, y_train, y_test)"""
+    fs = FeatureStore(RAW_DIR, PROC_DIR, WH_DIR, feature_metadata)
+    fs.build_feature_store(CSV_URL, api_url=API_URL)
+    return fs.split_and_store(target_col="Churn")
+
 # -----------------------------
 # Run Example
 # -----------------------------
 if __name__ == "__main__":
-    CSV_URL = "https://raw.githubusercontent.com/SohelRaja/Customer-Churn-Analysis/master/Decision%20Tree/WA_Fn-UseC_-Telco-Customer-Churn.csv"
-    API_URL = "https://jsonplaceholder.typicode.com/users"
-
     fs = FeatureStore(RAW_DIR, PROC_DIR, WH_DIR, feature_metadata)
     fs.build_feature_store(CSV_URL, api_url=API_URL)
     fs.split_and_store(target_col="Churn")
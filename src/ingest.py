@@ -1,6 +1,8 @@
 import os
+import shutil
 import pandas as pd
 import requests
+from requests_cache import CachedSession
 import logging
 from prefect import flow, task
 from prefect.logging import get_run_logger
@@ -17,6 +19,10 @@ os.makedirs(RAW_DIR, exist_ok=True)
 os.makedirs(STORAGE_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# Local HTTP cache for the (static) users API; honours Cache-Control and
+# revalidates with ETag/Last-Modified once an entry is older than an hour
+SESSION = CachedSession("data/http_cache", expire_after=3600, cache_control=True)
+
 # Configure a dedicated file handler
 log_file = os.path.join(LOG_DIR, "ingest.log")
 file_handler = logging.FileHandler(log_file)
@@ -35,22 +41,28 @@ prefect_logger.setLevel(logging.INFO)
 def ingest_csv():
     logger = get_run_logger()
     url = "https://raw.githubusercontent.com/SohelRaja/Customer-Churn-Analysis/master/Decision%20Tree/WA_Fn-UseC_-Telco-Customer-Churn.csv"
-    df = pd.read_csv(url)
     filepath = f"{RAW_DIR}/churn.csv"
-    df.to_csv(filepath, index=False)
+    # Stream the bytes straight to disk; no need to parse and re-serialize the CSV
+    with requests.get(url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True  # undo any transfer gzip
+        with open(filepath, "wb") as f:
+            shutil.copyfileobj(response.raw, f, length=1 << 20)
     logger.info(f"CSV ingestion successful. Data saved at {filepath}")
+    return filepath
 
 @task(retries=3, retry_delay_seconds=30)
 def ingest_api():
     logger = get_run_logger()
     url = "https://jsonplaceholder.typicode.com/users"
-    response = requests.get(url, timeout=10)
+    response = SESSION.get(url, timeout=10)
     response.raise_for_status()
     data = response.json()
     df = pd.DataFrame(data)
     filepath = f"{RAW_DIR}/users.csv"
     df.to_csv(filepath, index=False)
     logger.info(f"API ingestion successful. Data saved at {filepath}")
+    return df
 
 # -----------------------------
 # Prefect Flow
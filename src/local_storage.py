@@ -1,4 +1,7 @@
 # local_storage.py
+import os
+import re
+from collections import defaultdict
 from pathlib import Path
 from datetime import datetime
 import shutil
@@ -15,19 +18,37 @@ LOG_DIR = BASE_DIR / "logs"
 STORAGE_DIR.mkdir(parents=True, exist_ok=True)
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
-logging.basicConfig(
-    filename=LOG_DIR / "storage.log",
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-)
+# Dedicated file handler so the log stays separate when imported by the flow
 logger = logging.getLogger("storage")
+file_handler = logging.FileHandler(LOG_DIR / "storage.log")
+file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+logger.addHandler(file_handler)
+logger.setLevel(logging.INFO)
+
+# -----------------------------
+# Helper: Clone a file's contents without a userspace copy
+# -----------------------------
+def clone_file(src_file: Path, dest_file: Path):
+    """Copy via copy_file_range (reflink/CoW on filesystems that support it)"""
+    # Not a hardlink: ingest rewrites data/raw in place, which would alter old partitions
+    try:
+        with open(src_file, "rb") as src, open(dest_file, "wb") as dst:
+            remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    except (AttributeError, OSError):
+        # copy_file_range unavailable (non-Linux, old kernel, cross-filesystem)
+        shutil.copy(src_file, dest_file)
+
 
 # -----------------------------
 # Helper: Store a file into partitioned folders
 # -----------------------------
-def store_file(filename: str, source_type: str):
+def store_file(filename: str, source_type: str, timestamp: str):
     """Copy a raw file into a timestamped folder under its source type"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     dest_dir = STORAGE_DIR / source_type / timestamp
     dest_dir.mkdir(parents=True, exist_ok=True)
 
@@ -39,7 +60,7 @@ def store_file(filename: str, source_type: str):
         logger.error(msg)
         raise FileNotFoundError(msg)
 
-    shutil.copy(src_file, dest_file)
+    clone_file(src_file, dest_file)
     msg = f"[Storage] {filename} → {dest_file}"
     logger.info(msg)
     print(msg)
@@ -50,6 +71,8 @@ def store_file(filename: str, source_type: str):
 # -----------------------------
 def run_storage():
     logger.info("Starting local storage process...")
+    # One partition timestamp per run (shared with the other stages when run by the flow)
+    timestamp = os.environ.get("CHURN_RUN_TS") or datetime.now().strftime("%Y%m%d_%H%M%S")
 
     # List of files to store
     files_to_store = [
@@ -58,11 +81,53 @@ def run_storage():
     ]
 
     for filename, source_type in files_to_store:
-        store_file(filename, source_type)
+        store_file(filename, source_type, timestamp)
 
     logger.info("Local storage process completed successfully.")
 
 
+# -----------------------------
+# Retention: retire old versioned artifacts
+# -----------------------------
+TIMESTAMP_PATTERN = re.compile(r"\d{8}_\d{6}")
+
+def retire_old_artifacts(keep: int = 20):
+    """Keep only the `keep` newest timestamped versions of each artifact in the managed folders"""
+    # The lake (data/lake) and the reports are left alone: the lake is immutable and keeps
+    # every historical version for reproducibility (see Data_Lake_Architecture.md)
+    managed_dirs = [
+        RAW_DIR,
+        BASE_DIR / "data" / "processed",
+        BASE_DIR / "warehouse",
+        BASE_DIR / "warehouse" / "splits" / "split=train",
+        BASE_DIR / "warehouse" / "splits" / "split=test",
+    ]
+    removed = 0
+    for folder in managed_dirs:
+        if not folder.is_dir():
+            continue
+        # Group versions by name minus timestamp (e.g. "churn_raw_.csv", "run_ts=");
+        # names without a timestamp (churn.csv, users.csv, ...) are never touched
+        versions = defaultdict(list)
+        with os.scandir(folder) as it:
+            for entry in it:
+                match = TIMESTAMP_PATTERN.search(entry.name)
+                if match:
+                    kind = entry.name[:match.start()] + entry.name[match.end():]
+                    versions[kind].append((match.group(), entry))
+        for entries in versions.values():
+            entries.sort(key=lambda v: v[0], reverse=True)
+            for _, entry in entries[keep:]:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+                removed += 1
+
+    logger.info(f"Retired {removed} old artifacts (kept {keep} newest per kind)")
+    return removed
+
+
 # -----------------------------
 # For standalone run
 # -----------------------------
@@ -1,7 +1,12 @@
 # prepare.py
 import pandas as pd
 import os
-from sklearn.preprocessing import StandardScaler
+import hashlib
+import joblib
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import StandardScaler, OneHotEncoder
+import matplotlib
+matplotlib.use("Agg")  # headless backend; the flow renders plots from worker threads
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
@@ -13,50 +18,63 @@ import logging
 RAW_DIR = "data/lake"
 PROC_DIR = "data/processed"
 REPORT_DIR = "data/reports"
+WH_DIR = "warehouse"
 LOG_DIR = "logs"
 
 os.makedirs(PROC_DIR, exist_ok=True)
+os.makedirs(WH_DIR, exist_ok=True)
 os.makedirs(REPORT_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
 
-logging.basicConfig(
-    filename=f"{LOG_DIR}/prepare.log",
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
+# Per-column EDA plots are opt-in (CHURN_EDA=1); scheduled runs only write summary stats
+EDA_ENABLED = os.getenv("CHURN_EDA", "0") == "1"
+
+# Dedicated file handler so the log stays separate when imported by the flow
 logger = logging.getLogger("prepare")
+file_handler = logging.FileHandler(f"{LOG_DIR}/prepare.log")
+file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+logger.addHandler(file_handler)
+logger.setLevel(logging.INFO)
+
+# Known Telco column types; declaring them skips type inference while parsing.
+# Blank TotalCharges (" ") are read as missing instead of forcing a text column.
+CHURN_DTYPES = {
+    "SeniorCitizen": "int64",
+    "tenure": "int64",
+    "MonthlyCharges": "float64",
+    "TotalCharges": "float64",
+}
 
 # -----------------------------
 # Helper: get latest file for a source
 # -----------------------------
 def get_latest_file(folder):
-    all_dates = sorted(os.listdir(folder), reverse=True)
-    if not all_dates:
+    # Single scandir pass; timestamped partition names sort chronologically, and naming
+    # (not mtime) is what validate uses too, so both stages pick the same partition
+    with os.scandir(folder) as it:
+        latest_folder = max((e for e in it if e.is_dir()), key=lambda e: e.name, default=None)
+    if latest_folder is None:
         raise FileNotFoundError(f"No folders found in {folder}")
-    latest_folder = os.path.join(folder, all_dates[0])
-    files = os.listdir(latest_folder)
-    if not files:
-        raise FileNotFoundError(f"No files found in {latest_folder}")
-    return os.path.join(latest_folder, files[0])
+    with os.scandir(latest_folder.path) as it:
+        first_file = next((e for e in it if e.is_file()), None)
+    if first_file is None:
+        raise FileNotFoundError(f"No files found in {latest_folder.path}")
+    return first_file.path
 
 # -----------------------------
 # Data Preparation Function
 # -----------------------------
 def prepare_dataset(file_path, dataset_name):
-    df = pd.read_csv(file_path)
+    read_kwargs = {"dtype": CHURN_DTYPES, "na_values": [" "]} if dataset_name == "churn" else {}
+    df = pd.read_csv(file_path, engine="pyarrow", **read_kwargs)
     logger.info(f"Preparing dataset: {file_path}")
     print(f"[Prepare] Dataset: {file_path} | Rows: {df.shape[0]} | Columns: {df.shape[1]}")
 
     # -----------------------------
-    # Handle missing values
+    # Handle missing values (TotalCharges is parsed as float, so it is covered here)
     # -----------------------------
     numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
     df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())
-    
-    # Convert TotalCharges to numeric if exists
-    if 'TotalCharges' in df.columns:
-        df['TotalCharges'] = pd.to_numeric(df['TotalCharges'], errors='coerce')
-        df['TotalCharges'] = df['TotalCharges'].fillna(df['TotalCharges'].median())
 
     # -----------------------------
     # Encode categorical variables
@@ -68,46 +86,65 @@ def prepare_dataset(file_path, dataset_name):
     if 'customerID' in df.columns:
         df = df.drop('customerID', axis=1)
 
-    categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
-    if categorical_cols:
-        df = pd.get_dummies(df, columns=categorical_cols, drop_first=True)
-
     # -----------------------------
-    # Standardize numerical attributes
+    # One-hot encode categoricals & standardize numerics in a single pass
     # -----------------------------
-    scaler = StandardScaler()
     numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
-    df[numeric_cols] = scaler.fit_transform(df[numeric_cols])
+    categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
+
+    # Preprocessors are keyed by the input schema (column names + dtypes); a scheduled
+    # re-run on the same schema reuses the fitted one instead of refitting the scaling
+    schema_key = hashlib.sha1(pd.util.hash_pandas_object(df.dtypes.astype(str)).values).hexdigest()
+    preprocessor_path = os.path.join(WH_DIR, f"preprocessor_{schema_key}.pkl")
+
+    if os.path.exists(preprocessor_path):
+        preprocessor = joblib.load(preprocessor_path)
+        df = preprocessor.transform(df)
+        logger.info(f"Reused fitted preprocessor {preprocessor_path}")
+    else:
+        preprocessor = ColumnTransformer(
+            [
+                ("num", StandardScaler(), numeric_cols),
+                # bool dummies named <col>_<value>, matching the former pd.get_dummies output
+                ("cat", OneHotEncoder(drop="first", handle_unknown="ignore", sparse_output=False, dtype=bool), categorical_cols),
+            ],
+            remainder="passthrough",
+            verbose_feature_names_out=False,
+        ).set_output(transform="pandas")
+        df = preprocessor.fit_transform(df)
+        joblib.dump(preprocessor, preprocessor_path)
+        logger.info(f"Fitted preprocessor saved at {preprocessor_path}")
 
     # -----------------------------
     # Save prepared dataset
     # -----------------------------
-    output_path = os.path.join(PROC_DIR, f"{dataset_name}_prepared.csv")
-    df.to_csv(output_path, index=False)
+    output_path = os.path.join(PROC_DIR, f"{dataset_name}_prepared.parquet")
+    df.to_parquet(output_path, engine="pyarrow", compression="zstd", index=False)
     print(f"[Prepare] Prepared dataset saved at {output_path}")
     logger.info(f"Prepared dataset saved at {output_path}")
 
     # -----------------------------
     # EDA: visualizations and summary stats
     # -----------------------------
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    # Histograms for numeric columns
-    for col in numeric_cols:
-        plt.figure(figsize=(6,4))
-        sns.histplot(df[col], bins=30, kde=True)
-        plt.title(f"{dataset_name} - {col} distribution")
-        plt.tight_layout()
-        plt.savefig(os.path.join(REPORT_DIR, f"{dataset_name}_{col}_hist_{timestamp}.png"))
-        plt.close()
-
-    # Boxplots for numeric columns
-    for col in numeric_cols:
-        plt.figure(figsize=(6,4))
-        sns.boxplot(y=df[col])
-        plt.title(f"{dataset_name} - {col} boxplot")
-        plt.tight_layout()
-        plt.savefig(os.path.join(REPORT_DIR, f"{dataset_name}_{col}_box_{timestamp}.png"))
-        plt.close()
+    timestamp = os.environ.get("CHURN_RUN_TS") or datetime.now().strftime("%Y%m%d_%H%M%S")
+    if EDA_ENABLED:
+        # Histograms for numeric columns
+        for col in numeric_cols:
+            plt.figure(figsize=(6,4))
+            sns.histplot(df[col], bins=30, kde=True)
+            plt.title(f"{dataset_name} - {col} distribution")
+            plt.tight_layout()
+            plt.savefig(os.path.join(REPORT_DIR, f"{dataset_name}_{col}_hist_{timestamp}.png"))
+            plt.close()
+
+        # Boxplots for numeric columns
+        for col in numeric_cols:
+            plt.figure(figsize=(6,4))
+            sns.boxplot(y=df[col])
+            plt.title(f"{dataset_name} - {col} boxplot")
+            plt.tight_layout()
+            plt.savefig(os.path.join(REPORT_DIR, f"{dataset_name}_{col}_box_{timestamp}.png"))
+            plt.close()
 
     # Summary statistics
     summary_path = os.path.join(REPORT_DIR, f"{dataset_name}_summary_{timestamp}.csv")
@@ -115,20 +152,26 @@ def prepare_dataset(file_path, dataset_name):
     print(f"[Prepare] Summary statistics saved at {summary_path}")
     logger.info(f"Summary statistics saved at {summary_path}")
 
+    return df
+
 # -----------------------------
 # Main Runner
 # -----------------------------
 def run_preparation():
+    """Prepare the latest file of every source; returns {prepared_name: DataFrame}"""
     sources = ["csv_source", "api_source"]
+    prepared = {}
     for source in sources:
         source_path = os.path.join(RAW_DIR, source)
         try:
             latest_file = get_latest_file(source_path)
             dataset_name = os.path.splitext(os.path.basename(latest_file))[0]
-            prepare_dataset(latest_file, dataset_name)
+            # Keyed like the saved file so transform names tables the same either way
+            prepared[f"{dataset_name}_prepared"] = prepare_dataset(latest_file, dataset_name)
         except FileNotFoundError as e:
             print(f"[Prepare] Warning: {e}")
             logger.warning(e)
+    return prepared
 
 if __name__ == "__main__":
     run_preparation()
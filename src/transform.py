@@ -1,6 +1,9 @@
 import pandas as pd
+import numpy as np
 import os
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+import io
+from pathlib import Path
+from sklearn.preprocessing import StandardScaler
 import sqlite3
 from datetime import datetime
 import logging
@@ -17,85 +20,89 @@ SUMMARY_FILE = "transform_summary.md"
 os.makedirs(DB_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
 
-logging.basicConfig(
-    filename=f"{LOG_DIR}/transform.log",
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
+# Dedicated file handler so the log stays separate when imported by the flow
 logger = logging.getLogger("transform")
+file_handler = logging.FileHandler(f"{LOG_DIR}/transform.log")
+file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+logger.addHandler(file_handler)
+logger.setLevel(logging.INFO)
 
 # -----------------------------
 # Helper: get latest processed file for a source
 # -----------------------------
 def get_latest_file(folder, source):
-    source_files = [f for f in os.listdir(folder) if f.startswith(source)]
-    if not source_files:
+    # Single scandir pass picking the latest match by name, like the other stages; this
+    # stage's own <source>_transformed output shares the prefix and is skipped
+    with os.scandir(folder) as it:
+        latest = max(
+            (e for e in it if e.name.startswith(source) and e.name.endswith(".parquet")
+             and "_transformed" not in e.name),
+            key=lambda e: e.name,
+            default=None,
+        )
+    if latest is None:
         raise FileNotFoundError(f"No processed files found for source '{source}' in {folder}")
-    latest_file = sorted(source_files, reverse=True)[0]
-    return os.path.join(folder, latest_file)
+    return latest.path
 
 # -----------------------------
-# Generate SQL Schema
+# Generate SQL Schema (into the run's in-memory buffer)
 # -----------------------------
-def generate_schema(table_name, df, schema_path):
-    with open(schema_path, "a") as f:
-        f.write(f"-- Schema for {table_name}\n")
-        f.write(f"CREATE TABLE {table_name} (\n")
-        cols = []
-        for col, dtype in zip(df.columns, df.dtypes):
-            if "int" in str(dtype):
-                sql_type = "INTEGER"
-            elif "float" in str(dtype):
-                sql_type = "REAL"
-            else:
-                sql_type = "TEXT"
-            cols.append(f"    {col} {sql_type}")
-        f.write(",\n".join(cols))
-        f.write("\n);\n\n")
+def sql_type(dtype):
+    if "int" in str(dtype):
+        return "INTEGER"
+    elif "float" in str(dtype):
+        return "REAL"
+    return "TEXT"
+
+def generate_schema(table_name, df, schema_buf):
+    schema_buf.write(f"-- Schema for {table_name}\n")
+    schema_buf.write(f"CREATE TABLE {table_name} (\n")
+    schema_buf.write(",\n".join(f"    {col} {sql_type(dtype)}" for col, dtype in zip(df.columns, df.dtypes)))
+    schema_buf.write("\n);\n\n")
 
 # -----------------------------
-# Update Transformation Summary
+# Update Transformation Summary (into the run's in-memory buffer)
 # -----------------------------
-def update_summary(dataset_name, df, summary_path):
-    with open(summary_path, "a") as f:
-        f.write(f"## Dataset: {dataset_name}\n")
-        f.write(f"- Total rows: {df.shape[0]}\n")
-        f.write(f"- Total columns: {df.shape[1]}\n")
-        f.write("- Derived Features:\n")
-        derived_features = []
-        if "TotalSpend" in df.columns:
-            derived_features.append("TotalSpend = tenure * MonthlyCharges")
-        if "TenureYears" in df.columns:
-            derived_features.append("TenureYears = tenure / 12")
-        if "AvgMonthlySpend" in df.columns:
-            derived_features.append("AvgMonthlySpend = TotalSpend / tenure")
-        for feat in derived_features:
-            f.write(f"  - {feat}\n")
-        f.write("- Scaled numeric features using StandardScaler\n")
-        f.write("- Encoded categorical columns using LabelEncoder\n\n")
+def update_summary(dataset_name, df, summary_buf):
+    summary_buf.write(f"## Dataset: {dataset_name}\n")
+    summary_buf.write(f"- Total rows: {df.shape[0]}\n")
+    summary_buf.write(f"- Total columns: {df.shape[1]}\n")
+    summary_buf.write("- Derived Features:\n")
+    derived_features = []
+    if "TotalSpend" in df.columns:
+        derived_features.append("TotalSpend = tenure * MonthlyCharges")
+    if "TenureYears" in df.columns:
+        derived_features.append("TenureYears = tenure / 12")
+    if "AvgMonthlySpend" in df.columns:
+        derived_features.append("AvgMonthlySpend = TotalSpend / tenure")
+    for feat in derived_features:
+        summary_buf.write(f"  - {feat}\n")
+    summary_buf.write("- Scaled numeric features using StandardScaler\n")
+    summary_buf.write("- Encoded categorical columns as pandas category codes\n\n")
 
 # -----------------------------
 # Feature Engineering / Transformation
 # -----------------------------
-def transform_dataset(file_path, dataset_name):
-    df = pd.read_csv(file_path)
-    logger.info(f"Transforming dataset: {file_path}")
-    print(f"[Transform] Dataset: {file_path} | Rows: {df.shape[0]} | Columns: {df.shape[1]}")
+def transform_dataset(df, dataset_name, schema_buf, summary_buf):
+    logger.info(f"Transforming dataset: {dataset_name}")
+    print(f"[Transform] Dataset: {dataset_name} | Rows: {df.shape[0]} | Columns: {df.shape[1]}")
 
     # -----------------------------
     # Feature Engineering
     # -----------------------------
     if 'tenure' in df.columns and 'MonthlyCharges' in df.columns:
-        df['TotalSpend'] = df['tenure'] * df['MonthlyCharges']
-        df['TenureYears'] = df['tenure'] / 12
-        df['AvgMonthlySpend'] = df['TotalSpend'] / df['tenure']
+        tenure = df['tenure'].to_numpy(dtype=float)
+        total = tenure * df['MonthlyCharges'].to_numpy(dtype=float)
+        # tenure == 0 yields 0 instead of inf/NaN
+        avg = np.divide(total, tenure, out=np.zeros_like(total), where=tenure != 0)
+        df = df.assign(TotalSpend=total, TenureYears=tenure / 12.0, AvgMonthlySpend=avg)
 
-    # Label encode categorical features
+    # Encode categorical features as category codes (one factorize per column, int8/int16 codes)
     for col in df.select_dtypes(include='object').columns:
-        df[col] = LabelEncoder().fit_transform(df[col])
+        df[col] = pd.Categorical(df[col]).codes
 
-    # Standardize numeric features
-    numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
+    # Standardize numeric features ("number" covers the narrow code dtypes, not bool dummies)
+    numeric_cols = df.select_dtypes(include='number').columns.tolist()
     df[numeric_cols] = StandardScaler().fit_transform(df[numeric_cols])
 
     # -----------------------------
@@ -106,24 +113,29 @@ def transform_dataset(file_path, dataset_name):
     else:
         transformed_name = f"{dataset_name}_transformed"
 
-    # Save transformed CSV
-    transformed_csv_path = os.path.join(PROC_DIR, f"{transformed_name}.csv")
-    df.to_csv(transformed_csv_path, index=False)
-    logger.info(f"Transformed CSV saved at {transformed_csv_path}")
-    print(f"[Transform] Transformed dataset saved at {transformed_csv_path}")
+    # Save transformed Parquet
+    transformed_path = os.path.join(PROC_DIR, f"{transformed_name}.parquet")
+    df.to_parquet(transformed_path, engine="pyarrow", compression="zstd", index=False)
+    logger.info(f"Transformed dataset saved at {transformed_path}")
+    print(f"[Transform] Transformed dataset saved at {transformed_path}")
 
     # Save to SQLite database
     db_path = os.path.join(DB_DIR, "churn_data.db")
     conn = sqlite3.connect(db_path)
+    # Bulk-load settings: WAL journal, no fsync per commit, temp structures in memory
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
     table_name = transformed_name.lower() + "_table"
-    df.to_sql(table_name, conn, if_exists='replace', index=False)
+    with conn:  # one commit for the whole executemany insert
+        df.to_sql(table_name, conn, if_exists='replace', index=False)
     conn.close()
     logger.info(f"Dataset stored in SQLite DB: {db_path} | Table: {table_name}")
     print(f"[Transform] Dataset stored in SQLite DB: {db_path} | Table: {table_name}")
 
     # Generate schema & summary
-    generate_schema(table_name, df, SCHEMA_FILE)
-    update_summary(dataset_name, df, SUMMARY_FILE)
+    generate_schema(table_name, df, schema_buf)
+    update_summary(dataset_name, df, summary_buf)
 
     # Example queries
     print(f"[Transform] Sample queries for table '{table_name}':")
@@ -132,27 +144,43 @@ def transform_dataset(file_path, dataset_name):
     if 'TotalSpend' in df.columns:
         print(f"3. SELECT AVG(TotalSpend) FROM {table_name};")
 
+    return df
+
 # -----------------------------
 # Main Runner
 # -----------------------------
-def run_transformation():
-    # Clear previous schema & summary before new run
-    open(SCHEMA_FILE, "w").close()
-    open(SUMMARY_FILE, "w").close()
-
-    sources = ["churn_prepared", "users_prepared"]
+def run_transformation(prepared=None):
+    """Transform prepared datasets; returns {transformed_name: DataFrame}
+
+    `prepared` maps dataset names to DataFrames handed over in memory by the
+    prepare step. When omitted, the latest prepared files are read from disk.
+    """
+    if prepared is None:
+        prepared = {}
+        sources = ["churn_prepared", "users_prepared"]
+        for source in sources:
+            try:
+                latest_file = get_latest_file(PROC_DIR, source)
+                dataset_name = os.path.splitext(os.path.basename(latest_file))[0]
+                prepared[dataset_name] = pd.read_parquet(latest_file, engine="pyarrow")
+                logger.info(f"Loaded prepared dataset: {latest_file}")
+            except FileNotFoundError as e:
+                logger.warning(e)
+                print(f"[Transform] Warning: {e}")
+
+    # Schema & summary are buffered for the whole run and replace the previous files once
+    schema_buf = io.StringIO()
+    summary_buf = io.StringIO()
     created_tables = []
+    transformed = {}
 
-    for source in sources:
-        try:
-            latest_file = get_latest_file(PROC_DIR, source)
-            dataset_name = os.path.splitext(os.path.basename(latest_file))[0]
-            transform_dataset(latest_file, dataset_name)
-            transformed_name = dataset_name if dataset_name.endswith("_transformed") else f"{dataset_name}_transformed"
-            created_tables.append(transformed_name.lower() + "_table")
-        except FileNotFoundError as e:
-            logger.warning(e)
-            print(f"[Transform] Warning: {e}")
+    for dataset_name, df in prepared.items():
+        transformed_name = dataset_name if dataset_name.endswith("_transformed") else f"{dataset_name}_transformed"
+        transformed[transformed_name] = transform_dataset(df, dataset_name, schema_buf, summary_buf)
+        created_tables.append(transformed_name.lower() + "_table")
+
+    Path(SCHEMA_FILE).write_text(schema_buf.getvalue())
+    Path(SUMMARY_FILE).write_text(summary_buf.getvalue())
 
     # List all created tables at the end
     if created_tables:
@@ -162,5 +190,7 @@ def run_transformation():
     else:
         print("\n[Transform]  No tables were created. Check your input files.")
 
+    return transformed
+
 if __name__ == "__main__":
     run_transformation()
@@ -1,7 +1,18 @@
 # validate.py
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+from numba import njit
 import os
+import sys
+import json
+import mmap
 from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import logging
 
 # -----------------------------
@@ -10,99 +21,305 @@ import logging
 STORAGE_DIR = "data/lake"
 REPORT_DIR = "data/reports"
 LOG_DIR = "logs"
+CHUNK_BYTES = 64 << 20  # CSV bytes parsed per streamed batch
+MANIFEST_PATH = os.path.join(REPORT_DIR, ".validate_cache.json")
 
-os.makedirs(REPORT_DIR, exist_ok=True)
-os.makedirs(LOG_DIR, exist_ok=True)
+# Declared column types per source, pushed into the CSV reader so it skips inference.
+# Low-cardinality columns are "category" (dictionary-encoded), so hashing works on small
+# integer codes; TotalCharges stays a string: blanks in it are what the validator reports on
+SCHEMAS = {
+    "csv_source": {
+        "customerID": "string", "gender": "category", "SeniorCitizen": "int64",
+        "Partner": "category", "Dependents": "category", "tenure": "int64",
+        "PhoneService": "category", "MultipleLines": "category", "InternetService": "category",
+        "OnlineSecurity": "category", "OnlineBackup": "category", "DeviceProtection": "category",
+        "TechSupport": "category", "StreamingTV": "category", "StreamingMovies": "category",
+        "Contract": "category", "PaperlessBilling": "category", "PaymentMethod": "category",
+        "MonthlyCharges": "float64", "TotalCharges": "string", "Churn": "category",
+    },
+    "api_source": {
+        "id": "int64", "name": "string", "username": "string", "email": "string",
+        "address": "string", "phone": "string", "website": "string", "company": "string",
+    },
+}
 
-logging.basicConfig(
-    filename=f"{LOG_DIR}/validate.log",
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
+# Only create what is missing; on a provisioned tree this is one stat per folder
+for d in (REPORT_DIR, LOG_DIR):
+    if not os.path.isdir(d):
+        os.makedirs(d, exist_ok=True)
+
+# Dedicated file handler so the log stays separate when imported by the flow
 logger = logging.getLogger("validate")
+file_handler = logging.FileHandler(f"{LOG_DIR}/validate.log")
+file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+logger.addHandler(file_handler)
+# Console output goes through the same logger, so every line is formatted and emitted once
+stream_handler = logging.StreamHandler(sys.stdout)
+stream_handler.setFormatter(logging.Formatter("[Validate] %(message)s"))
+logger.addHandler(stream_handler)
+logger.setLevel(logging.INFO)
+# Don't also hand records to the root handlers (Prefect's console), or each line prints twice
+logger.propagate = False
+
+class DatasetLogger(logging.LoggerAdapter):
+    """Prefixes each record with its dataset, since sources are validated concurrently"""
+    def process(self, msg, kwargs):
+        return f"[{self.extra['dataset']}] {msg}", kwargs
 
 # -----------------------------
 # Helper: get latest file for a source
 # -----------------------------
 def get_latest_file(folder):
-    all_dates = sorted(os.listdir(folder), reverse=True)
-    if not all_dates:
+    # Timestamped partition names sort chronologically, so one max() pass finds the latest
+    with os.scandir(folder) as it:
+        latest = max((e for e in it if e.is_dir()), key=lambda e: e.name, default=None)
+    if latest is None:
         raise FileNotFoundError(f"No folders found in {folder}")
-    latest_folder = os.path.join(folder, all_dates[0])
-    files = os.listdir(latest_folder)
-    if not files:
-        raise FileNotFoundError(f"No files found in {latest_folder}")
-    return os.path.join(latest_folder, files[0])
+    with os.scandir(latest.path) as it:
+        first = next(it, None)
+    if first is None:
+        raise FileNotFoundError(f"No files found in {latest.path}")
+    return first.path
+
+# -----------------------------
+# Helper: row count without parsing
+# -----------------------------
+def quick_stats(path, block_size=1 << 20):
+    """Data rows and byte size from a newline count; a quoted field spanning lines counts extra"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0, 0  # mmap refuses zero-length files
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = sum(mm[i:i + block_size].count(b"\n") for i in range(0, size, block_size))
+        if mm[size - 1] != ord("\n"):
+            lines += 1  # last line without a trailing newline
+    return max(lines - 1, 0), size  # minus the header
+
+# -----------------------------
+# TotalCharges check (compiled kernel)
+# -----------------------------
+# No fastmath: it lets the compiler assume no NaNs and drop the v != v test.
+# No on-disk cache either: it records the importing module name, and this module is
+# imported both as `validate` and `src.validate`; compiling a loop this small is cheap
+@njit
+def _check_totalcharges(a):
+    n_neg = 0
+    n_nan = 0
+    for i in range(a.size):
+        v = a[i]
+        if v != v:
+            n_nan += 1
+        elif v < 0.0:
+            n_neg += 1
+    return n_neg, n_nan
+
+# -----------------------------
+# Per-schema plans (built once, cached)
+# -----------------------------
+def _arrow_type(alias):
+    if alias == "category":
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.type_for_alias(alias)
+
+def _pandas_type(arrow_type):
+    # None keeps pyarrow's default conversion, which turns dictionary columns into Categoricals
+    return None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type)
+
+@lru_cache(maxsize=None)
+def _convert_options(schema_items):
+    # Declared columns skip inference; empty strings count as missing like they did with pd.read_csv
+    return pv.ConvertOptions(
+        column_types={col: _arrow_type(alias) for col, alias in schema_items},
+        strings_can_be_null=True,
+    )
+
+@lru_cache(maxsize=None)
+def _chunk_validator(arrow_schema):
+    """Chunk fold specialised to one Arrow schema; the type dispatch runs once per schema"""
+    columns = arrow_schema.names
+    total_type = arrow_schema.field("TotalCharges").type if "TotalCharges" in columns else None
+
+    if total_type is None:
+        def total_counts(chunk):
+            return 0, 0
+    elif pa.types.is_integer(total_type) or pa.types.is_floating(total_type):
+        def total_counts(chunk):
+            return _check_totalcharges(chunk["TotalCharges"].to_numpy(dtype=np.float64, na_value=np.nan))
+    else:
+        def total_counts(chunk):
+            arr = pd.to_numeric(chunk["TotalCharges"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            return _check_totalcharges(arr)
+
+    def fold(batch, chunk, uniques, seen_rows):
+        # Null counts are kept in Arrow array metadata; unique runs on Arrow's hash kernels
+        # and only each batch's distinct non-null values reach the Python set
+        missing = np.array([column.null_count for column in batch.columns], dtype=np.int64)
+        for col, column in zip(columns, batch.columns):
+            uniques[col].update(pc.drop_null(pc.unique(column)).to_pylist())
+
+        # One uint64 hash per row; rows whose hash was already seen are duplicates
+        row_hashes = pd.util.hash_pandas_object(chunk, index=False, categorize=True)
+        seen_before = len(seen_rows)
+        seen_rows.update(row_hashes.tolist())
+        duplicates = len(chunk) - (len(seen_rows) - seen_before)
+
+        n_neg, n_nan = total_counts(chunk)
+        return missing, duplicates, n_neg, n_nan
+
+    return fold
 
 # -----------------------------
 # Validation function
 # -----------------------------
-def validate_file(file_path):
-    df = pd.read_csv(file_path)
-    logger.info(f"Validating file: {file_path}")
-    print(f"[Validate] File: {file_path}")
-    print(f"[Validate] Rows: {df.shape[0]}, Columns: {df.shape[1]}")
+def validate_file(file_path, report_path, dataset_name, schema=None, quick_only=False):
+    log = DatasetLogger(logger, {"dataset": dataset_name})
+    log.info("Validating file: %s", file_path)
+    approx_rows, size = quick_stats(file_path)
+    log.info("Quick stats: ~%s rows, %s bytes", approx_rows, size)
+    # The Arrow reader rejects a zero-byte file outright
+    if size == 0:
+        log.warning("Empty file %s, skipping report", file_path)
+        return None
+    if quick_only:
+        return None
+
+    # Stream the file in chunks and fold each one into per-column accumulators,
+    # so peak memory is one chunk plus the counters rather than the whole file
+    rows = 0
+    dtypes = fold = None
+    seen_rows = set()
+    duplicates = 0
+    invalid_total = invalid_nan = 0
+
+    # Multithreaded Arrow CSV parser, streamed batch by batch
+    convert_options = _convert_options(tuple((schema or {}).items()))
+    try:
+        reader = pv.open_csv(file_path, read_options=pv.ReadOptions(block_size=CHUNK_BYTES),
+                             convert_options=convert_options)
+    except pa.ArrowInvalid:
+        # A header without a trailing newline is rejected as an empty CSV at open
+        if approx_rows == 0:
+            log.warning("Empty file %s, skipping report", file_path)
+            return None
+        raise
+    with reader:
+        for batch in reader:
+            chunk = batch.to_pandas(types_mapper=_pandas_type)
+            if fold is None:
+                dtypes = chunk.dtypes
+                uniques = {col: set() for col in chunk.columns}
+                missing = np.zeros(len(dtypes), dtype=np.int64)
+                fold = _chunk_validator(batch.schema)
+            rows += len(chunk)
+
+            chunk_missing, chunk_duplicates, n_neg, n_nan = fold(batch, chunk, uniques, seen_rows)
+            missing += chunk_missing
+            duplicates += chunk_duplicates
+            invalid_total += n_neg
+            invalid_nan += n_nan
+
+    # Header-only file: nothing to measure, so skip the reductions and the report
+    if rows == 0:
+        log.warning("Empty file %s, skipping report", file_path)
+        return None
+
+    missing = pd.Series(missing, index=dtypes.index)
+    log.info("Rows: %s, Columns: %s", rows, len(dtypes))
 
+    # Series are passed as %s args, so they are only rendered if the record is emitted
     # 1. Missing values
-    missing = df.isnull().sum()
-    missing_count = missing.sum()
-    print(f"[Validate] Missing values per column:\n{missing}")
-    if missing_count > 0:
-        logger.warning(f"Missing values found:\n{missing}")
+    level = logging.WARNING if missing.sum() > 0 else logging.INFO
+    log.log(level, "Missing values per column:\n%s", missing)
 
     # 2. Data types
-    print(f"[Validate] Data types:\n{df.dtypes}")
-    logger.info(f"Data types:\n{df.dtypes}")
+    log.info("Data types:\n%s", dtypes)
 
     # 3. Duplicates
-    duplicates = df.duplicated().sum()
-    print(f"[Validate] Duplicate rows: {duplicates}")
-    if duplicates > 0:
-        logger.warning(f"Found {duplicates} duplicate rows")
+    log.log(logging.WARNING if duplicates > 0 else logging.INFO, "Duplicate rows: %s", duplicates)
 
     # 4. Numeric ranges and conversion (example for TotalCharges)
-    if 'TotalCharges' in df.columns:
-        df['TotalCharges'] = pd.to_numeric(df['TotalCharges'], errors='coerce')
-        invalid_total = df[df['TotalCharges'] < 0].shape[0]
-        print(f"[Validate] Rows with TotalCharges < 0: {invalid_total}")
-        if invalid_total > 0:
-            logger.warning(f"Rows with invalid TotalCharges: {invalid_total}")
-        invalid_nan = df['TotalCharges'].isna().sum()
-        print(f"[Validate] Rows with invalid/missing TotalCharges: {invalid_nan}")
-        if invalid_nan > 0:
-            logger.warning(f"Rows with invalid/missing TotalCharges: {invalid_nan}")
+    if 'TotalCharges' in dtypes.index:
+        log.log(logging.WARNING if invalid_total > 0 else logging.INFO,
+                "Rows with TotalCharges < 0: %s", invalid_total)
+        log.log(logging.WARNING if invalid_nan > 0 else logging.INFO,
+                "Rows with invalid/missing TotalCharges: %s", invalid_nan)
 
     # -----------------------------
     # Generate Data Quality Report
     # -----------------------------
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    dataset_name = os.path.splitext(os.path.basename(file_path))[0]
-    report_path = os.path.join(REPORT_DIR, f"{dataset_name}_data_quality_{timestamp}.csv")
-
     report = pd.DataFrame({
-        'Column': df.columns,
-        'DataType': df.dtypes,
-        'MissingValues': df.isnull().sum(),
-        'UniqueValues': df.nunique()
+        'Column': dtypes.index,
+        'DataType': dtypes.astype(str),
+        'MissingValues': missing,
+        'UniqueValues': pd.Series({col: len(values) for col, values in uniques.items()})
     })
 
-    report.to_csv(report_path, index=False)
-    print(f"[Validate] Data quality report saved at {report_path}")
-    logger.info(f"Data quality report saved at {report_path}")
+    # Feather: columnar and written straight from Arrow buffers, no per-cell CSV formatting
+    report.reset_index(drop=True).to_feather(report_path)
+    log.info("Data quality report saved at %s", report_path)
+    return report_path
 
 # -----------------------------
 # Main Runner
 # -----------------------------
+def _validate_source(source, manifest, timestamp):
+    """Validate the latest file of one source; returns its new manifest entry, or None"""
+    source_path = os.path.join(STORAGE_DIR, source)
+    try:
+        latest_file = os.path.abspath(get_latest_file(source_path))
+        st = os.stat(latest_file)
+        entry = manifest.get(latest_file)
+        if (entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+                and os.path.exists(entry["report"])):
+            logger.info("Skipping unchanged file %s (report: %s)", latest_file, entry["report"])
+            return None
+        dataset_name = Path(latest_file).stem
+        report_path = os.path.join(REPORT_DIR, f"{dataset_name}_data_quality_{timestamp}.feather")
+        report_path = validate_file(latest_file, report_path, dataset_name, SCHEMAS.get(source))
+        if report_path is None:
+            return None
+        return latest_file, {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "report": report_path}
+    except FileNotFoundError as e:
+        logger.warning("Warning: %s", e)
+        return None
+    except pa.ArrowInvalid as e:
+        # A value that doesn't parse as its declared (or first-block inferred) type is a
+        # data-quality failure to report, not a reason to stop validating the other source
+        logger.error("Validation failed for %s: %s", source, e)
+        return None
+
 def run_validation():
+    # Manifest of validated inputs: abs path -> size, mtime and the report it produced
+    try:
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+
+    # One report timestamp for the whole run
+    timestamp = os.environ.get("CHURN_RUN_TS") or datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Sources are independent; the Arrow parser and NumPy reductions release the GIL,
+    # so threads overlap one source's parse with the other's I/O
     sources = ["csv_source", "api_source"]
-    for source in sources:
-        source_path = os.path.join(STORAGE_DIR, source)
-        try:
-            latest_file = get_latest_file(source_path)
-            validate_file(latest_file)
-        except FileNotFoundError as e:
-            print(f"[Validate] Warning: {e}")
-            logger.warning(e)
+    with ThreadPoolExecutor(max_workers=len(sources)) as ex:
+        results = list(ex.map(lambda source: _validate_source(source, manifest, timestamp), sources))
+
+    # Manifest updates stay on this thread
+    for result in results:
+        if result is not None:
+            latest_file, entry = result
+            manifest[latest_file] = entry
+
+    # Drop entries for lake partitions that no longer exist (e.g. retired by gc_artifacts),
+    # so the manifest only tracks files that can still be revalidated
+    manifest = {path: entry for path, entry in manifest.items() if os.path.exists(path)}
+
+    # Write to a temp file and swap it in, so a crash never leaves a torn manifest
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
 
 if __name__ == "__main__":
     run_validation()